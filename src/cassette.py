@@ -0,0 +1,308 @@
+import atexit
+import builtins
+import gzip
+import hashlib
+import json
+import re
+import smtplib
+import time
+from collections import defaultdict, deque
+from datetime import date, datetime, timezone
+
+import config
+from logger import logger
+
+REDACTED = '[REDACTED]'
+
+_interactions = []
+_graphql_responses = defaultdict(deque)
+_graphql_operations = defaultdict(deque)
+_smtp_sessions = deque()
+
+# State loaded from disk during the run, such as the email cache, so a replay never reads local files
+_state = {}
+
+# The date of the recorded run, so a replay selects the same issues on any later day
+_today = None
+
+
+def _request_key(query, variables):
+    # Whitespace is collapsed, so reformatting a query does not invalidate the cassette
+    query = ' '.join(query.split())
+    return hashlib.sha1(json.dumps([query, variables], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _operation_key(query, variables):
+    match = re.search(r'\b(?:query|mutation)\s+(\w+)', query)
+    return (match.group(1) if match else ''), json.dumps(variables, sort_keys=True)
+
+
+def _next_unused(interactions):
+    """
+    Pop the next recorded interaction that was not replayed yet through the other index
+    """
+    while interactions:
+        interaction = interactions.popleft()
+        if not interaction.get('replayed'):
+            interaction['replayed'] = True
+            return interaction
+
+    return None
+
+
+def _redact(value):
+    """
+    Replace the secrets of the run wherever they appear in the recorded value
+    """
+    if isinstance(value, dict):
+        return {key: _redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact(item) for item in value]
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if not isinstance(value, str):
+        return value if value is None or isinstance(value, (bool, int, float)) else str(value)
+
+    # Only string values are searched, so a secret can never corrupt the recorded structure
+    for secret in [config.gh_token, getattr(config, 'smtp_password', None)]:
+        if secret:
+            value = value.replace(secret, REDACTED)
+
+    return value
+
+
+def _replay_latency(latency):
+    if config.cassette_speed:
+        time.sleep(latency * config.cassette_speed)
+
+
+def today():
+    """
+    Return the date of the run, which is the recorded one when replaying
+    """
+    return _today or datetime.now().date()
+
+
+def sleep(seconds):
+    """
+    Wait between notifications, scaled by `cassette_speed` when replaying
+    """
+    if config.cassette_mode == 'replay':
+        _replay_latency(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def _replay_error(error):
+    """
+    Rebuild a recorded exception, falling back to a plain Exception for unknown types
+    """
+    error_type = getattr(smtplib, error['type'], None) or getattr(builtins, error['type'], None)
+    if not isinstance(error_type, type) or not issubclass(error_type, Exception):
+        error_type = Exception
+
+    try:
+        return error_type(error['message'])
+    except TypeError:
+        return Exception(error['message'])
+
+
+def start():
+    """
+    Load the cassette in replay mode or make sure it is saved at exit in record mode
+    """
+    global _today
+
+    if config.cassette_mode == 'record':
+        _today = datetime.now().date()
+        atexit.register(save)
+        logger.info('Recording GraphQL and SMTP traffic to %s', config.cassette_file)
+    elif config.cassette_mode == 'replay':
+        with gzip.open(config.cassette_file, 'rt') as f:
+            recorded = json.load(f)
+
+        if recorded.get('today'):
+            _today = date.fromisoformat(recorded['today'])
+
+        _state.update(recorded.get('state') or {})
+
+        for interaction in recorded['interactions']:
+            if interaction['type'] == 'graphql':
+                # The keys are computed again, so cassettes recorded before a key change still match
+                _graphql_responses[_request_key(interaction['query'], interaction['variables'])].append(interaction)
+                _graphql_operations[_operation_key(interaction['query'], interaction['variables'])].append(interaction)
+            elif interaction['type'] == 'smtp':
+                _smtp_sessions.append(interaction)
+
+        logger.info(
+            'Replaying %d interactions recorded on %s from %s (speed %s, run date %s)',
+            len(recorded['interactions']), recorded.get('recorded_at'), config.cassette_file, config.cassette_speed, today()
+        )
+
+
+def save():
+    """
+    Write the recorded interactions to the compressed cassette file
+    """
+    if config.cassette_mode != 'record' or not _interactions:
+        return
+
+    with gzip.open(config.cassette_file, 'wt') as f:
+        json.dump({
+            'version': 1,
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+            'today': today().isoformat(),
+            'state': _state,
+            'interactions': _interactions,
+        }, f)
+
+    logger.info('%d interactions recorded to %s', len(_interactions), config.cassette_file)
+    _interactions.clear()
+
+
+def state(name: str, load):
+    """
+    Return the state loaded with `load`, recorded in the cassette in record mode
+    and taken from the cassette instead of calling `load` in replay mode
+    """
+    if config.cassette_mode == 'replay':
+        return json.loads(json.dumps(_state.get(name) or {}))
+
+    value = load()
+    if config.cassette_mode == 'record':
+        _state[name] = _redact(value)
+
+    return value
+
+
+def graphql(query, variables, send):
+    """
+    Return the body of the GraphQL request, sent with `send`, recorded or replayed depending on the cassette mode
+    """
+    if config.cassette_mode == 'replay':
+        variables = _redact(variables)
+        interaction = _next_unused(_graphql_responses[_request_key(query, variables)])
+
+        # The query was edited since the recording, fall back to the operation name and variables
+        if not interaction:
+            operation_key = _operation_key(query, variables)
+            interaction = _next_unused(_graphql_operations[operation_key])
+            if interaction:
+                logger.warning('Query %s differs from the recorded one, replaying the response recorded for the same operation and variables', operation_key[0])
+
+        if not interaction:
+            raise Exception(f'No recorded GraphQL response for {query.split("(")[0].strip()} {variables}')
+
+        _replay_latency(interaction['latency'])
+
+        return interaction['response']
+
+    if config.cassette_mode != 'record':
+        return send()
+
+    started = time.perf_counter()
+    body = send()
+    latency = time.perf_counter() - started
+
+    variables = _redact(variables)
+    _interactions.append({
+        'type': 'graphql',
+        'key': _request_key(query, variables),
+        'query': query,
+        'variables': variables,
+        'response': _redact(body),
+        'latency': latency,
+    })
+
+    return body
+
+
+class RecordingSMTP:
+    """
+    Wrap a smtplib connection and record every command with its latency and outcome
+    """
+
+    def __init__(self, session, connect):
+        self.session = session
+        self.server = self._record('connect', connect)
+
+    def _record(self, command, call, *args):
+        event = {'command': command, 'args': _redact(list(args))}
+        started = time.perf_counter()
+        try:
+            result = call(*args)
+            event['result'] = _redact(result) if command != 'connect' else None
+            return result
+        except Exception as e:
+            event['error'] = {'type': type(e).__name__, 'message': str(e)}
+            raise
+        finally:
+            event['latency'] = time.perf_counter() - started
+            self.session['events'].append(event)
+
+    def starttls(self):
+        return self._record('starttls', self.server.starttls)
+
+    def login(self, username, password):
+        return self._record('login', self.server.login, username, password)
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        return self._record('sendmail', self.server.sendmail, from_addr, to_addrs, msg)
+
+    def close(self):
+        self.server.close()
+
+
+class ReplaySMTP:
+    """
+    Serve the commands of a recorded SMTP session back, with the recorded latencies and errors
+    """
+
+    def __init__(self, session):
+        self.events = deque(session['events'])
+        self._replay('connect')
+
+    def _replay(self, command):
+        if not self.events or self.events[0]['command'] != command:
+            raise Exception(f'Unexpected SMTP command {command}, the cassette does not match this run')
+
+        event = self.events.popleft()
+        _replay_latency(event['latency'])
+        if event.get('error'):
+            raise _replay_error(event['error'])
+
+        result = event.get('result')
+        return tuple(result) if isinstance(result, list) else result
+
+    def starttls(self):
+        return self._replay('starttls')
+
+    def login(self, username, password):
+        return self._replay('login')
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        return self._replay('sendmail')
+
+    def close(self):
+        pass
+
+
+def smtp(host, port, use_ssl, timeout):
+    """
+    Open a SMTP connection, recorded or replayed depending on the cassette mode
+    """
+    smtp_class = smtplib.SMTP_SSL if use_ssl else smtplib.SMTP
+
+    if config.cassette_mode == 'replay':
+        if not _smtp_sessions:
+            raise Exception(f'No recorded SMTP session for {host}:{port}')
+
+        return ReplaySMTP(_smtp_sessions.popleft())
+
+    if config.cassette_mode != 'record':
+        return smtp_class(host, port, timeout=timeout)
+
+    session = {'type': 'smtp', 'host': host, 'port': port, 'use_ssl': use_ssl, 'events': []}
+    _interactions.append(session)
+
+    return RecordingSMTP(session, lambda: smtp_class(host, port, timeout=timeout))
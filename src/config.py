@@ -15,12 +15,54 @@ duedate_field_name = os.environ['INPUT_DUEDATE_FIELD_NAME']
 notification_type = os.environ['INPUT_NOTIFICATION_TYPE']
 notify_for = os.environ['INPUT_NOTIFY_FOR']
 
+log_format = os.environ.get('INPUT_LOG_FORMAT') or 'text'
+log_verbosity = os.environ.get('INPUT_LOG_VERBOSITY') or 'summary'
+log_sample_rate = int(os.environ.get('INPUT_LOG_SAMPLE_RATE') or 100)
+
+if log_format not in ['text', 'json']:
+    raise Exception(f'Unsupported log format {log_format}')
+
+if log_verbosity not in ['summary', 'sampled', 'verbose']:
+    raise Exception(f'Unsupported log verbosity {log_verbosity}')
+
 if notification_type not in ['comment', 'email']:
     raise Exception(f'Unsupported notification type {notification_type}')
 
 if notify_for not in ['expiring_issues', 'missing_duedate', 'overdue_issues']:
     raise Exception(f'Unsupported notify_for value {notification_type}')
 
+scan_repositories = True if os.environ.get('INPUT_SCAN_REPOSITORIES') == 'True' else False
+repositories = [name.strip() for name in os.environ.get('INPUT_REPOSITORIES', '').split(',') if name.strip()]
+repository_batch_size = int(os.environ.get('INPUT_REPOSITORY_BATCH_SIZE') or 10)
+
+if repository_batch_size < 1:
+    raise Exception(f'Invalid repository_batch_size value {repository_batch_size}')
+
+low_memory = True if os.environ.get('INPUT_LOW_MEMORY') == 'True' else False
+max_items = int(os.environ.get('INPUT_MAX_ITEMS') or 1000)
+memory_report = True if os.environ.get('INPUT_MEMORY_REPORT') == 'True' else False
+
+if max_items < 1:
+    raise Exception(f'Invalid max_items value {max_items}')
+
+cassette_mode = os.environ.get('INPUT_CASSETTE_MODE') or 'off'
+cassette_file = os.environ.get('INPUT_CASSETTE_FILE') or 'cassette.json.gz'
+cassette_speed = float(os.environ.get('INPUT_CASSETTE_SPEED') or 1)
+
+if cassette_mode not in ['off', 'record', 'replay']:
+    raise Exception(f'Unsupported cassette mode {cassette_mode}')
+
+if cassette_speed < 0:
+    raise Exception(f'Invalid cassette_speed value {cassette_speed}')
+
+shard_index = int(os.environ.get('INPUT_SHARD_INDEX') or 0)
+shard_count = int(os.environ.get('INPUT_SHARD_COUNT') or 1)
+shard_results_dir = os.environ.get('INPUT_SHARD_RESULTS_DIR') or 'shard-results'
+merge_shard_results = True if os.environ.get('INPUT_MERGE_SHARD_RESULTS') == 'True' else False
+
+if shard_count < 1 or not 0 <= shard_index < shard_count:
+    raise Exception(f'Invalid shard {shard_index} of {shard_count}')
+
 if notification_type == 'email':
     smtp_server = os.environ['INPUT_SMTP_SERVER']
     smtp_port = os.environ['INPUT_SMTP_PORT']
@@ -28,4 +70,7 @@ if notification_type == 'email':
     smtp_password = os.environ['INPUT_SMTP_PASSWORD']
     smtp_from_email = os.environ['INPUT_SMTP_FROM_EMAIL']
     smtp_cc_email = os.environ['INPUT_SMTP_CC_EMAIL']
+    email_mapping_file = os.environ.get('INPUT_EMAIL_MAPPING_FILE', '')
+    email_cache_file = os.environ.get('INPUT_EMAIL_CACHE_FILE', '')
+    email_cache_ttl = int(os.environ.get('INPUT_EMAIL_CACHE_TTL') or 86400)
 
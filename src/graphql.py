@@ -1,92 +1,266 @@
 from pprint import pprint
 
 import requests
+import cassette
 import config
+import shard
+from logger import logger
 
 
-def get_repo_issues(owner, repository, duedate_field_name, after=None, issues=None):
-    query = """
-    query GetRepoIssues($owner: String!, $repo: String!, $duedate: String!, $statusFieldName: String!, $after: String) {
-          repository(owner: $owner, name: $repo) {
-            issues(first: 100, after: $after, states: [OPEN]) {
-              nodes {
-                id
-                title
-                number
-                url
-                assignees(first:100) {
-                  nodes {
-                    name
-                    email
-                    login
-                  }
-                }
-                projectItems(first: 10) {
-                  nodes {
-                    project {
-                      number
-                      title
-                    }
-                    fieldValueByName(name: $duedate) {
-                      ... on ProjectV2ItemFieldDateValue {
-                        id
-                        date
-                      }
-                    }
-                    statusField: fieldValueByName(name: $statusFieldName) {
-                      ... on ProjectV2ItemFieldSingleSelectValue {
-                        id
-                        name
-                      }
-                    }
-                  }
-                }
-              }
-              pageInfo {
+def _post(query, variables):
+    """
+    Send the query to the GraphQL API and return the decoded body.
+    Goes through the cassette, so the exchange can be recorded or replayed.
+    """
+    def send():
+        response = requests.post(
+            config.api_endpoint,
+            json={"query": query, "variables": variables},
+            headers={"Authorization": f"Bearer {config.gh_token}"}
+        )
+        return response.json()
+
+    body = cassette.graphql(query, variables, send)
+    if body.get('errors'):
+        print(body.get('errors'))
+
+    return body
+
+
+def get_owner_repositories(owner, owner_type, after=None, repositories=None):
+    query = f"""
+    query GetOwnerRepositories($owner: String!, $after: String) {{
+          {owner_type}(login: $owner) {{
+            repositories(first: 100, after: $after, isArchived: false) {{
+              nodes {{
+                name
+              }}
+              pageInfo {{
                 endCursor
                 hasNextPage
-                hasPreviousPage
-              }
-              totalCount
-            }
-          }
-        }
+              }}
+            }}
+          }}
+        }}
     """
 
     variables = {
         'owner': owner,
-        'repo': repository,
-        'duedate': duedate_field_name,
-        'statusFieldName': "Status",
         'after': after
     }
 
-    response = requests.post(
-        config.api_endpoint,
-        json={"query": query, "variables": variables},
-        headers={"Authorization": f"Bearer {config.gh_token}"}
-    )
-
-    if response.json().get('errors'):
-        print(response.json().get('errors'))
+    body = _post(query, variables)
 
-    pageinfo = response.json().get('data').get('repository').get('issues').get('pageInfo')
-    if issues is None:
-        issues = []
-    issues = issues + response.json().get('data').get('repository').get('issues').get('nodes')
+    pageinfo = body.get('data').get(owner_type).get('repositories').get('pageInfo')
+    if repositories is None:
+        repositories = []
+    repositories = repositories + [node['name'] for node in body.get('data').get(owner_type).get('repositories').get('nodes')]
     if pageinfo.get('hasNextPage'):
-        return get_repo_issues(
+        return get_owner_repositories(
             owner=owner,
-            repository=repository,
+            owner_type=owner_type,
             after=pageinfo.get('endCursor'),
-            issues=issues,
-            duedate_field_name=duedate_field_name
+            repositories=repositories
         )
 
-    return issues
+    return repositories
+
+
+REPO_ISSUES_FRAGMENT = """
+    fragment RepoIssues on IssueConnection {
+      nodes {
+        id
+        title
+        number
+        state
+        url
+        assignees(first: 20) {
+          nodes {
+            name
+            email
+            login
+          }
+        }
+        projectItems(first: 10) {
+          nodes {
+            id
+            project {
+              number
+              owner {
+                ... on User {
+                  login
+                }
+                ... on Organization {
+                  login
+                }
+              }
+            }
+            fieldValueByName(name: $duedate) {
+              ... on ProjectV2ItemFieldDateValue {
+                id
+                date
+              }
+            }
+            statusField: fieldValueByName(name: $statusFieldName) {
+              ... on ProjectV2ItemFieldSingleSelectValue {
+                id
+                name
+              }
+            }
+          }
+        }
+      }
+      pageInfo {
+        endCursor
+        hasNextPage
+      }
+    }
+"""
+
+
+def iter_repos_issues(owner, repositories, project_number, duedate_field_name, filters=None, batch_size=10):
+    """
+    Scan the open issues of many repositories, batching several repositories per query with aliases.
+    Each alias paginates independently and only the issues assigned to the given project of the owner are kept,
+    yielded in the same shape as the project items of iter_project_issues.
+    """
+    # Cursor of the next page for every repository that still has pages left
+    pending = {repository: None for repository in repositories}
+    while pending:
+        batch = list(pending.items())[:batch_size]
+
+        definitions = []
+        selections = []
+        variables = {
+            'owner': owner,
+            'duedate': duedate_field_name,
+            'statusFieldName': "Status"
+        }
+        for index, (repository, after) in enumerate(batch):
+            definitions.append(f'$repo{index}: String!, $after{index}: String')
+            selections.append(f"""
+          repo{index}: repository(owner: $owner, name: $repo{index}) {{
+            issues(first: 100, after: $after{index}, states: [OPEN]) {{
+              ...RepoIssues
+            }}
+          }}""")
+            variables[f'repo{index}'] = repository
+            variables[f'after{index}'] = after
+
+        query = f"""
+    query GetReposIssues($owner: String!, $duedate: String!, $statusFieldName: String!, {', '.join(definitions)}) {{{''.join(selections)}
+        }}
+    {REPO_ISSUES_FRAGMENT}"""
+
+        body = _post(query, variables)
+
+        # The whole request failed, do not mistake the batch for missing repositories
+        data = body.get('data')
+        if not data:
+            raise Exception(f'Failed to fetch the issues of repositories {", ".join(repository for repository, _ in batch)}')
+
+        for index, (repository, after) in enumerate(batch):
+            # Inaccessible or missing repositories resolve to null, skip them
+            if not data.get(f'repo{index}'):
+                logger.warning('Skipping repository %s/%s, it is missing or not accessible', owner, repository)
+                del pending[repository]
+                continue
+
+            connection = data[f'repo{index}']['issues']
+            for issue in connection['nodes']:
+                projectItems = issue.pop('projectItems')['nodes']
+
+                # Check if the desired project is assigned to the issue. Project numbers are only
+                # unique per owner, so the project must also belong to the owner of the repositories
+                projectItem = next((
+                    entry for entry in projectItems
+                    if entry['project']['number'] == project_number
+                    and (entry['project'].get('owner') or {}).get('login', '').lower() == owner.lower()
+                ), None)
+                if not projectItem:
+                    continue
+
+                yield from _decode_items([{
+                    'id': projectItem['id'],
+                    'fieldValueByName': projectItem['fieldValueByName'],
+                    'statusField': projectItem['statusField'],
+                    'content': issue
+                }], filters)
+
+            if connection['pageInfo'].get('hasNextPage'):
+                pending[repository] = connection['pageInfo'].get('endCursor')
+            else:
+                del pending[repository]
+
+
+def get_repos_issues(owner, repositories, project_number, duedate_field_name, filters=None, batch_size=10):
+    return list(iter_repos_issues(
+        owner=owner,
+        repositories=repositories,
+        project_number=project_number,
+        duedate_field_name=duedate_field_name,
+        filters=filters,
+        batch_size=batch_size
+    ))
 
 
-def get_project_issues(owner, owner_type, project_number, duedate_field_name, filters=None, after=None, issues=None):
+def get_repo_issues(owner, repository, project_number, duedate_field_name, filters=None):
+    return get_repos_issues(
+        owner=owner,
+        repositories=[repository],
+        project_number=project_number,
+        duedate_field_name=duedate_field_name,
+        filters=filters
+    )
+
+
+def _compact_item(node):
+    """
+    Keep only the fields of the project item that are used to send the notifications
+    """
+    content = node.get('content')
+    if content:
+        content = {
+            'id': content.get('id'),
+            'title': content.get('title'),
+            'number': content.get('number'),
+            'state': content.get('state'),
+            'url': content.get('url'),
+            'assignees': {
+                'nodes': [
+                    {'login': assignee.get('login'), 'email': assignee.get('email')}
+                    for assignee in (content.get('assignees') or {}).get('nodes', [])
+                ]
+            }
+        }
+
+    return {
+        'id': node['id'],
+        'fieldValueByName': {'date': node['fieldValueByName']['date']} if node.get('fieldValueByName') else None,
+        'statusField': {'name': node['statusField']['name']} if node.get('statusField') else None,
+        'content': content or {}
+    }
+
+
+def _decode_items(nodes, filters):
+    """
+    Drop the project items that do not match the given filters and compact the rest
+    """
+    filters = filters or {}
+    for node in nodes:
+        if filters.get('open_only') and (node.get('content') or {}).get('state') != 'OPEN':
+            continue
+        if filters.get('empty_duedate') and node['fieldValueByName']:
+            continue
+        if filters.get('shard') and not shard.owns_item(node['id'], *filters['shard']):
+            continue
+        yield _compact_item(node)
+
+
+def iter_project_issues(owner, owner_type, project_number, duedate_field_name, filters=None):
+    """
+    Yield the project items page by page, so only one raw page is held in memory at a time
+    """
     query = f"""
     query GetProjectIssues($owner: String!, $projectNumber: Int!, $duedate: String!, $statusFieldName: String!, $after: String)  {{
           {owner_type}(login: $owner) {{
@@ -138,54 +312,81 @@ def get_project_issues(owner, owner_type, project_number, duedate_field_name, fi
         }}
     """
 
-    variables = {
-        'owner': owner,
-        'projectNumber': project_number,
-        'duedate': duedate_field_name,
-        'statusFieldName': "Status" ,
-        'after': after
-    }
+    after = None
+    while True:
+        variables = {
+            'owner': owner,
+            'projectNumber': project_number,
+            'duedate': duedate_field_name,
+            'statusFieldName': "Status" ,
+            'after': after
+        }
 
-    response = requests.post(
-        config.api_endpoint,
-        json={"query": query, "variables": variables},
-        headers={"Authorization": f"Bearer {config.gh_token}"}
-    )
+        body = _post(query, variables)
 
-    if response.json().get('errors'):
-        print(response.json().get('errors'))
+        items = body.get('data').get(owner_type).get('projectV2').get('items')
+        pageinfo = items.get('pageInfo')
 
-    pageinfo = response.json().get('data').get(owner_type).get('projectV2').get('items').get('pageInfo')
-    if issues is None:
-        issues = []
+        yield from _decode_items(items.get('nodes'), filters)
 
-    nodes = response.json().get('data').get(owner_type).get('projectV2').get('items').get('nodes')
+        # Drop the raw page before fetching the next one
+        del body, items
 
-    if filters:
-        filtered_issues = []
-        for node in nodes:
-            if filters.get('open_only') and node['content'].get('state') != 'OPEN':
-                continue
-            if filters.get('empty_duedate') and node['fieldValueByName']:
-                continue
-            filtered_issues.append(node)
+        if not pageinfo.get('hasNextPage'):
+            return
+        after = pageinfo.get('endCursor')
 
-        nodes = filtered_issues
 
-    issues = issues + nodes
+def get_project_issues(owner, owner_type, project_number, duedate_field_name, filters=None):
+    return list(iter_project_issues(
+        owner=owner,
+        owner_type=owner_type,
+        project_number=project_number,
+        duedate_field_name=duedate_field_name,
+        filters=filters
+    ))
 
-    if pageinfo.get('hasNextPage'):
-        return get_project_issues(
-            owner=owner,
-            owner_type=owner_type,
-            project_number=project_number,
-            after=pageinfo.get('endCursor'),
-            filters=filters,
-            issues=issues,
-            duedate_field_name=duedate_field_name
-        )
 
-    return issues
+def get_users_emails(logins, org=None, batch_size=100):
+    """
+    Get the email of the given users, querying up to `batch_size` users per request with aliases.
+    When an organization is given its verified domain email is used for users without a public email.
+    Users without any email map to None, users whose lookup failed are left out.
+    """
+    emails = {}
+    for start in range(0, len(logins), batch_size):
+        batch = logins[start:start + batch_size]
+
+        definitions = ['$org: String!'] if org else []
+        selections = []
+        variables = {'org': org} if org else {}
+        for index, login in enumerate(batch):
+            definitions.append(f'$login{index}: String!')
+            selections.append(f"""
+          user{index}: user(login: $login{index}) {{
+            login
+            email
+            {'organizationVerifiedDomainEmails(login: $org)' if org else ''}
+          }}""")
+            variables[f'login{index}'] = login
+
+        query = f"""
+    query GetUsersEmails({', '.join(definitions)}) {{{''.join(selections)}
+        }}
+    """
+
+        body = _post(query, variables)
+
+        data = body.get('data') or {}
+        for index, login in enumerate(batch):
+            user = data.get(f'user{index}')
+            # Failed lookups are left out, so they are not mistaken for users without email
+            if not user:
+                continue
+            domain_emails = user.get('organizationVerifiedDomainEmails') or []
+            emails[login.lower()] = user.get('email') or next(iter(domain_emails), None)
+
+    return emails
 
 
 def add_issue_comment(issueId, comment):
@@ -201,12 +402,6 @@ def add_issue_comment(issueId, comment):
         'issueId': issueId,
         'comment': comment
     }
-    response = requests.post(
-        config.api_endpoint,
-        json={"query": mutation, "variables": variables},
-        headers={"Authorization": f"Bearer {config.gh_token}"}
-    )
-    if response.json().get('errors'):
-        print(response.json().get('errors'))
+    body = _post(mutation, variables)
 
-    return response.json().get('data')
\ No newline at end of file
+    return body.get('data')
\ No newline at end of file
@@ -1,7 +1,106 @@
-import logging as logger
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from collections import Counter
+
+import config
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format the log records as one JSON object per line
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'event', None):
+            entry['event'] = record.event
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand the records to the queue untouched, so they are formatted by the listener thread
+    and the formatter still sees `exc_info`. The queue never leaves the process, so the
+    records do not have to be made picklable.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class ItemFilter(logging.Filter):
+    """
+    Count the per item records by event and only let through all of them (verbose),
+    one every `sample_rate` of every event (sampled) or none (summary).
+    Warnings and errors are always let through.
+    """
+
+    def __init__(self, verbosity, sample_rate):
+        super().__init__()
+        self.verbosity = verbosity
+        self.sample_rate = max(sample_rate, 1)
+        self.counts = Counter()
+
+    def filter(self, record):
+        self.counts[record.event] += 1
+
+        if record.levelno >= logging.WARNING or self.verbosity == 'verbose':
+            return True
+        if self.verbosity == 'sampled':
+            return (self.counts[record.event] - 1) % self.sample_rate == 0
+
+        return False
+
 
 """
-Setup the logger
+Setup the logger. The records are handed to a queue and written to stderr by a background thread,
+so the notification loops never block on the Actions log.
 """
-logger.basicConfig(level=logger.INFO)
+_handler = logging.StreamHandler(sys.stderr)
+if config.log_format == 'json':
+    _handler.setFormatter(JsonFormatter())
+else:
+    _handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+
+_queue = queue.SimpleQueue()
+_listener = logging.handlers.QueueListener(_queue, _handler)
+_listener.start()
+atexit.register(_listener.stop)
+
+logging.root.setLevel(logging.INFO)
+logging.root.addHandler(QueueHandler(_queue))
+
+logger = logging.getLogger('duedate')
+
+_item_filter = ItemFilter(config.log_verbosity, config.log_sample_rate)
+_item_logger = logging.getLogger('duedate.items')
+_item_logger.addFilter(_item_filter)
+
+
+def log_item(event: str, msg: str, *args, level=logging.INFO):
+    """
+    Log a per item message. The message is formatted lazily, only when it passes the verbosity filter.
+    """
+    _item_logger.log(level, msg, *args, extra={'event': event})
+
+
+def log_summary():
+    """
+    Log how many times each per item event happened during the run
+    """
+    if not _item_filter.counts:
+        return
 
+    logger.info('Summary: %s', ', '.join(f'{event}={count}' for event, count in sorted(_item_filter.counts.items())))
@@ -1,12 +1,78 @@
 from datetime import datetime, timedelta
-from logger import logger
+from logger import logger, log_item, log_summary
 import config
 import utils
 import graphql
-import time
+import recipients
+import memory
+import cassette
+import shard
+from itertools import islice
 
 ALLOWED_STATUSES = ("In Progress", "In review")
 
+
+def iter_issues(filters):
+    """
+    Iterate the project issues owned by this shard, either from the project or by scanning the repositories
+    """
+    if config.shard_count > 1:
+        filters['shard'] = (config.shard_index, config.shard_count)
+
+    if config.scan_repositories:
+        repositories = config.repositories or graphql.get_owner_repositories(
+            owner=config.repository_owner,
+            owner_type=config.repository_owner_type
+        )
+        logger.info('Scanning %d repositories', len(repositories))
+
+        return graphql.iter_repos_issues(
+            owner=config.repository_owner,
+            repositories=repositories,
+            project_number=config.project_number,
+            duedate_field_name=config.duedate_field_name,
+            filters=filters,
+            batch_size=config.repository_batch_size
+        )
+
+    return graphql.iter_project_issues(
+        owner=config.repository_owner,
+        owner_type=config.repository_owner_type,
+        project_number=config.project_number,
+        duedate_field_name=config.duedate_field_name,
+        filters=filters
+    )
+
+
+def get_issues(filters, stats):
+    """
+    Iterate the project issues, counting them in `stats`. In low memory mode at most `max_items`
+    issues are fetched at a time and the next batch is only fetched once they are notified.
+    """
+    issues = iter_issues(filters)
+    max_items = config.max_items if config.low_memory else None
+
+    while True:
+        with memory.track('fetch'):
+            batch = list(islice(issues, max_items))
+        if not batch:
+            return
+
+        stats['items'] += len(batch)
+
+        # Resolve the assignee emails once per batch
+        if config.notification_type == 'email':
+            with memory.track('recipients'):
+                recipients.fill_assignee_emails(batch)
+
+        # The caller sends the notifications of the batch before the next one is fetched
+        with memory.track('deliver'):
+            yield from batch
+
+        if not max_items:
+            return
+
+
 def notify_expiring_issues():
     # if config.is_enterprise:
     #     issues = graphql.get_project_issues(
@@ -23,22 +89,12 @@ def notify_expiring_issues():
     #         duedate_field_name=config.duedate_field_name,
     #     )
 
-    issues = graphql.get_project_issues(
-        owner=config.repository_owner,
-        owner_type=config.repository_owner_type,
-        project_number=config.project_number,
-        duedate_field_name=config.duedate_field_name,
-        filters={'open_only': True}
-    )
-
-
-    # Check if there are issues available
-    if not issues:
-        logger.info('No issues has been found')
-        return
+    stats = {'items': 0}
+    issues = get_issues(filters={'open_only': True}, stats=stats)
+    notified = []
 
     # Get the date for tomorrow
-    today = datetime.now().date()
+    today = cassette.today()
     upcoming = {today, today + timedelta(days=1), today + timedelta(days=2)}
 
     # Loop through issues
@@ -94,7 +150,9 @@ def notify_expiring_issues():
                 # Add the comment to the issue
                 graphql.add_issue_comment(issue['id'], comment)
 
-            logger.info(f'Comment added to issue #{issue["number"]} ({issue["id"]}) with due date on {duedate_obj}')
+            notified.append(issue['number'])
+
+            log_item('comment_added', 'Comment added to issue #%s (%s) with due date on %s', issue['number'], issue['id'], duedate_obj)
         elif config.notification_type == 'email':
             # Prepare the email content
             subject, message, to = utils.prepare_expiring_issue_email_message(
@@ -112,25 +170,24 @@ def notify_expiring_issues():
                     html_body=message
                 )
                 # Rate limit the email sending
-                time.sleep(2)
-
-            if to:
-                logger.info(f'Email sent to {to} for issue #{issue["number"]} with due date on {duedate_obj}')
+                cassette.sleep(2)
 
+            notified.append(issue['number'])
 
-def notify_missing_duedate():
-    issues = graphql.get_project_issues(
-        owner=config.repository_owner,
-        owner_type=config.repository_owner_type,
-        project_number=config.project_number,
-        duedate_field_name=config.duedate_field_name,
-        filters={'empty_duedate': True, 'open_only': True}
-    )
+            if to:
+                log_item('email_sent', 'Email sent to %s for issue #%s with due date on %s', to, issue['number'], duedate_obj)
 
     # Check if there are issues available
-    if not issues:
+    if not stats['items']:
         logger.info('No issues has been found')
-        return
+
+    return stats['items'], notified
+
+
+def notify_missing_duedate():
+    stats = {'items': 0}
+    issues = get_issues(filters={'empty_duedate': True, 'open_only': True}, stats=stats)
+    notified = []
 
     for projectItem in issues:
         issue = projectItem['content']
@@ -161,7 +218,9 @@ def notify_missing_duedate():
                 # Add the comment to the issue
                 graphql.add_issue_comment(issue['id'], comment)
 
-            logger.info(f'Comment added to issue #{issue["number"]} ({issue["id"]})')
+            notified.append(issue['number'])
+
+            log_item('comment_added', 'Comment added to issue #%s (%s)', issue['number'], issue['id'])
         elif config.notification_type == 'email':
             # Prepare the email content
             subject, message, to = utils.prepare_missing_duedate_email_message(
@@ -178,28 +237,26 @@ def notify_missing_duedate():
                     html_body=message
                 )
                 # Rate limit the email sending
-                time.sleep(2)
-
-            logger.info(f'Email sent to {to} for issue #{issue["number"]}')
+                cassette.sleep(2)
 
+            notified.append(issue['number'])
 
-def notify_overdue_issues():
-    issues = graphql.get_project_issues(
-            owner=config.repository_owner,
-            owner_type=config.repository_owner_type,
-            project_number=config.project_number,
-            duedate_field_name=config.duedate_field_name,
-            filters={'open_only': True}
-        )
-
+            log_item('email_sent', 'Email sent to %s for issue #%s', to, issue['number'])
 
     # Check if there are issues available
-    if not issues:
+    if not stats['items']:
         logger.info('No issues has been found')
-        return
+
+    return stats['items'], notified
+
+
+def notify_overdue_issues():
+    stats = {'items': 0}
+    issues = get_issues(filters={'open_only': True}, stats=stats)
+    notified = []
 
     # Get the date for today
-    today = datetime.now().date()
+    today = cassette.today()
 
     # Loop through issues
     for issue in issues:
@@ -256,7 +313,9 @@ def notify_overdue_issues():
                 # Add the comment to the issue
                 graphql.add_issue_comment(issue['id'], comment)
 
-            logger.info(f'Comment added to issue #{issue["number"]} ({issue["id"]}) with due date on {duedate_obj}')
+            notified.append(issue['number'])
+
+            log_item('comment_added', 'Comment added to issue #%s (%s) with due date on %s', issue['number'], issue['id'], duedate_obj)
         elif config.notification_type == 'email':
             # Prepare the email content
             subject, message, to = utils.prepare_overdue_issue_email_message(
@@ -274,9 +333,17 @@ def notify_overdue_issues():
                     html_body=message
                 )
                 # Rate limit the email sending
-                time.sleep(2)
+                cassette.sleep(2)
+
+            notified.append(issue['number'])
+
+            log_item('email_sent', 'Email sent to %s for issue #%s with due date on %s', to, issue['number'], duedate_obj)
 
-            logger.info(f'Email sent to {to} for issue #{issue["number"]} with due date on {duedate_obj}')
+    # Check if there are issues available
+    if not stats['items']:
+        logger.info('No issues has been found')
+
+    return stats['items'], notified
 
 
 def main():
@@ -284,15 +351,47 @@ def main():
     if config.dry_run:
         logger.info("DRY RUN MODE ON!")
 
+    # Reduce step: merge the results written by the shard jobs and stop
+    if config.merge_shard_results:
+        shard.write_summary(shard.merge_partial_results(config.shard_results_dir))
+        return
+
+    if config.memory_report:
+        memory.start()
+
+    cassette.start()
+
+    if config.shard_count > 1:
+        logger.info("Processing shard %d of %d", config.shard_index, config.shard_count)
+
     if config.notify_for == "expiring_issues":
-        notify_expiring_issues()
+        items, notified = notify_expiring_issues()
     elif config.notify_for == "missing_duedate":
-        notify_missing_duedate()
+        items, notified = notify_missing_duedate()
     elif config.notify_for == "overdue_issues":
-        notify_overdue_issues()
+        items, notified = notify_overdue_issues()
     else:
         raise Exception("Unsupported value for argument 'notify_for'")
 
+    summary = {
+        'notify_for': config.notify_for,
+        'shard_index': config.shard_index,
+        'shard_count': config.shard_count,
+        'items': items,
+        'notified': notified,
+        'dry_run': config.dry_run,
+    }
+    if config.shard_count > 1:
+        shard.write_partial_result(summary)
+    else:
+        summary['shards'] = [config.shard_index]
+        shard.write_summary(summary)
+
+    recipients.save()
+    cassette.save()
+    log_summary()
+    memory.report()
+
 
 if __name__ == "__main__":
     main()
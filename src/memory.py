@@ -0,0 +1,45 @@
+import resource
+import tracemalloc
+from contextlib import contextmanager
+
+from logger import logger
+
+_peaks = {}
+
+
+def start():
+    """
+    Start tracing the Python allocations, so the peak memory of every phase can be reported
+    """
+    tracemalloc.start()
+
+
+@contextmanager
+def track(phase: str):
+    """
+    Record the peak traced memory while the block runs. A phase tracked several times keeps its highest peak.
+    """
+    if not tracemalloc.is_tracing():
+        yield
+        return
+
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        _peaks[phase] = max(_peaks.get(phase, 0), peak)
+
+
+def report():
+    """
+    Log the peak traced memory of every phase and the peak RSS of the process
+    """
+    if not tracemalloc.is_tracing():
+        return
+
+    for phase, peak in _peaks.items():
+        logger.info('Peak memory during %s: %.1f MiB', phase, peak / 1024 / 1024)
+
+    # ru_maxrss is reported in KiB on Linux
+    logger.info('Peak RSS: %.1f MiB', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+
+import cassette
+import config
+import graphql
+from logger import logger
+
+# The mapping file and the email cache are loaded once per run. The cache also keeps the
+# emails resolved during this run, so batches never look up the same login twice.
+_mapping = None
+_cache = None
+_cache_changed = False
+
+
+def load_mapping(path: str):
+    """
+    Load the login to email mapping from a JSON file ({"login": "email"})
+    """
+    if not path:
+        return {}
+
+    if not os.path.exists(path):
+        logger.warning('Email mapping file %s not found', path)
+        return {}
+
+    # The mapping is configuration, so a broken file stops the run instead of flooding the CC mailbox
+    try:
+        with open(path) as f:
+            mapping = json.load(f)
+    except (OSError, ValueError) as e:
+        raise Exception(f'Invalid email_mapping_file {path}: {e}')
+
+    if not isinstance(mapping, dict):
+        raise Exception(f'Invalid email_mapping_file {path}: expected a JSON object of login to email')
+
+    return {login.lower(): email for login, email in mapping.items() if email}
+
+
+def load_cache(path: str, ttl: int):
+    """
+    Load the cached emails that were resolved less than `ttl` seconds ago
+    """
+    if not path or not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning('Ignoring unreadable email cache %s: %s', path, e)
+        return {}
+
+    now = time.time()
+    return {login: entry for login, entry in cache.items() if now - entry.get('resolved_at', 0) < ttl}
+
+
+def save_cache(path: str, cache: dict):
+    if not path:
+        return
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, 'w') as f:
+        json.dump(cache, f)
+
+
+def resolve_emails(logins):
+    """
+    Resolve the email of the given logins from the cache, querying GitHub once for all the
+    logins that are not cached yet. Logins that could not be resolved are left out.
+    """
+    global _cache, _cache_changed
+
+    # A replay uses the cache recorded in the cassette, so it sends the same lookups as the recorded run
+    if _cache is None:
+        _cache = cassette.state('email_cache', lambda: load_cache(config.email_cache_file, config.email_cache_ttl))
+
+    logins = {login.lower() for login in logins}
+    emails = {login: _cache[login].get('email') for login in logins & _cache.keys()}
+
+    missing = logins - emails.keys()
+    if missing:
+        org = config.repository_owner if config.repository_owner_type == 'organization' else None
+        resolved = graphql.get_users_emails(sorted(missing), org=org)
+
+        # Only cache the logins GitHub answered for, failed lookups are retried later
+        now = time.time()
+        for login, email in resolved.items():
+            _cache[login] = {'email': email, 'resolved_at': now}
+            _cache_changed = True
+
+        emails.update(resolved)
+
+        failed = missing - resolved.keys()
+        if failed:
+            logger.warning('Could not look up the email of %s', ', '.join(sorted(failed)))
+
+    logger.info(
+        'Resolved %d of %d assignee emails (%d looked up)',
+        sum(1 for email in emails.values() if email), len(logins), len(missing)
+    )
+
+    return emails
+
+
+def save():
+    """
+    Write the emails looked up during this run to the email cache file, never when replaying a cassette
+    """
+    if _cache_changed and config.cassette_mode != 'replay':
+        save_cache(config.email_cache_file, _cache)
+
+
+def fill_assignee_emails(issues):
+    """
+    Set the email of the assignees of the given project items, once for all the unique logins.
+    The mapping file wins over the profile email, which wins over the resolved one.
+    """
+    global _mapping
+
+    if _mapping is None:
+        _mapping = load_mapping(config.email_mapping_file)
+
+    assignees = [
+        assignee
+        for item in issues
+        for assignee in ((item.get('content') or {}).get('assignees') or {}).get('nodes', [])
+        if assignee.get('login') and assignee['login'].strip()
+    ]
+
+    emails = resolve_emails({
+        assignee['login'] for assignee in assignees
+        if assignee['login'].lower() not in _mapping and not (assignee.get('email') or '').strip()
+    })
+
+    for assignee in assignees:
+        login = assignee['login'].lower()
+        email = _mapping.get(login) or (assignee.get('email') or '').strip() or emails.get(login)
+        if email:
+            assignee['email'] = email
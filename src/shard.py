@@ -0,0 +1,93 @@
+import glob
+import hashlib
+import json
+import os
+
+import config
+from logger import logger
+
+
+def owns_item(item_id: str, shard_index: int, shard_count: int):
+    """
+    Check whether the given project item belongs to the given shard.
+    A stable hash is used so every matrix job agrees on the partition.
+    """
+    digest = hashlib.sha1(item_id.encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % shard_count == shard_index
+
+
+def write_partial_result(summary: dict):
+    """
+    Write the summary of this shard to the shard results directory and return the file path
+    """
+    os.makedirs(config.shard_results_dir, exist_ok=True)
+    path = os.path.join(config.shard_results_dir, f'shard-{config.shard_index}-of-{config.shard_count}.json')
+    with open(path, 'w') as f:
+        json.dump(summary, f)
+
+    logger.info('Shard %d/%d result written to %s', config.shard_index, config.shard_count, path)
+
+    return path
+
+
+def merge_partial_results(results_dir: str):
+    """
+    Merge the shard summaries found in the given directory into a single summary
+    """
+    paths = sorted(glob.glob(os.path.join(results_dir, '**', 'shard-*.json'), recursive=True))
+    if not paths:
+        raise Exception(f'No shard results found in {results_dir}')
+
+    merged = {
+        'notify_for': None,
+        'shards': [],
+        'items': 0,
+        'notified': [],
+        'dry_run': False,
+    }
+    shard_count = 0
+    for path in paths:
+        with open(path) as f:
+            summary = json.load(f)
+
+        merged['notify_for'] = merged['notify_for'] or summary.get('notify_for')
+        merged['shards'].append(summary.get('shard_index'))
+        merged['items'] += summary.get('items', 0)
+        merged['notified'] += summary.get('notified', [])
+        merged['dry_run'] = merged['dry_run'] or summary.get('dry_run', False)
+        shard_count = max(shard_count, summary.get('shard_count', 0))
+
+    merged['shards'].sort()
+    merged['notified'].sort()
+
+    # Warn about shards that did not report back
+    missing = sorted(set(range(shard_count)) - set(merged['shards']))
+    if missing:
+        logger.warning('Missing results for shards %s', missing)
+
+    return merged
+
+
+def write_summary(summary: dict):
+    """
+    Log the merged summary and append it to the job summary when running inside GitHub Actions
+    """
+    # In dry run mode the notifications were only prepared, never sent
+    sent = 'prepared (dry run, not sent)' if summary.get('dry_run') else 'sent'
+
+    logger.info(
+        '%d notifications %s for %d items across %d shards',
+        len(summary['notified']), sent, summary['items'], len(summary['shards'])
+    )
+
+    step_summary = os.environ.get('GITHUB_STEP_SUMMARY')
+    if not step_summary:
+        return
+
+    with open(step_summary, 'a') as f:
+        f.write(f'### Due date reminders ({summary["notify_for"]})\n\n')
+        f.write(f'- Shards: {len(summary["shards"])}\n')
+        f.write(f'- Items processed: {summary["items"]}\n')
+        f.write(f'- Notifications {sent}: {len(summary["notified"])}\n')
+        if summary['notified']:
+            f.write(f'- Issues: {", ".join(f"#{number}" for number in summary["notified"])}\n')
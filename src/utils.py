@@ -1,8 +1,9 @@
-import smtplib
+import logging
+import cassette
 import config
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from logger import logger
+from logger import logger, log_item
 
 
 def prepare_missing_duedate_comment(issue: dict, assignees: dict):
@@ -16,10 +17,10 @@ def prepare_missing_duedate_comment(issue: dict, assignees: dict):
             if assignee.get("login") and assignee["login"].strip():
                 comment += f'@{assignee["login"]} '
     else:
-        logger.info(f'No assignees found for issue #{issue["number"]}')
+        log_item('no_assignees', 'No assignees found for issue #%s', issue['number'])
 
     comment += f'Kindly set the `Due Date` for this issue.'
-    logger.info(f'Issue {issue["title"]} | {comment}')
+    log_item('comment_prepared', 'Issue %s | %s', issue['title'], comment)
 
     return comment
 
@@ -35,10 +36,10 @@ def prepare_expiring_issue_comment(issue: dict, assignees: dict, duedate):
             if assignee.get("login") and assignee["login"].strip():
                 comment += f'@{assignee["login"]} '
     else:
-        logger.info(f'No assignees found for issue #{issue["number"]}')
+        log_item('no_assignees', 'No assignees found for issue #%s', issue['number'])
 
     comment += f'The issue is due on: {duedate.strftime("%b %d, %Y")}'
-    logger.info(f'Issue {issue["title"]} | {comment}')
+    log_item('comment_prepared', 'Issue %s | %s', issue['title'], comment)
 
     return comment
 
@@ -53,10 +54,10 @@ def prepare_overdue_issue_comment(issue: dict, assignees: dict, duedate):
             if assignee.get("login") and assignee["login"].strip():
                 comment += f'@{assignee["login"]} '
     else:
-        logger.info(f'No assignees found for issue #{issue["number"]}')
+        log_item('no_assignees', 'No assignees found for issue #%s', issue['number'])
 
     comment += f'The issue is overdue since: {duedate.strftime("%b %d, %Y")}'
-    logger.info(f'Issue {issue["title"]} | {comment}')
+    log_item('comment_prepared', 'Issue %s | %s', issue['title'], comment)
 
     return comment
 
@@ -74,7 +75,7 @@ def prepare_missing_duedate_email_message(issue, assignees):
             if assignee.get('email') and assignee['email'].strip():
                 mail_to.append(assignee['email'])
     else:
-        logger.info(f'No assignees found for issue #{issue["number"]}')
+        log_item('no_assignees', 'No assignees found for issue #%s', issue['number'])
 
     message = f"""
     <p>Reminder: The issue <strong>{issue['title']}</strong> (#{issue['number']}) has no due date.</p>
@@ -86,14 +87,12 @@ def prepare_missing_duedate_email_message(issue, assignees):
     return [subject, message, mail_to]
 
 
-from datetime import datetime
-
 def prepare_expiring_issue_email_message(issue, assignees, duedate):
     """
     Prepare the email message, subject and mail_to addresses
     """
     # Calculate remaining days until due date
-    today = datetime.now().date()
+    today = cassette.today()
     remaining_days = (duedate - today).days
 
     # if remaining_days is 0, then it is due today
@@ -113,7 +112,7 @@ def prepare_expiring_issue_email_message(issue, assignees, duedate):
             if assignee.get('email') and assignee['email'].strip():
                 mail_to.append(assignee['email'])
     else:
-        logger.info(f"No assignees found for issue #{issue['number']}")
+        log_item('no_assignees', 'No assignees found for issue #%s', issue['number'])
 
     # Adjust message based on remaining days
     if remaining_days == 0:
@@ -148,7 +147,7 @@ def prepare_overdue_issue_email_message(issue, assignees, duedate):
             if assignee.get('email') and assignee['email'].strip():
                 mail_to.append(assignee['email'])
     else:
-        logger.info(f"No assignees found for issue #{issue['number']}")
+        log_item('no_assignees', 'No assignees found for issue #%s', issue['number'])
 
     message = f"""
     <p>Reminder: The issue <strong>{issue['title']}</strong> (#{issue['number']}) is overdue since <strong>{duedate.strftime('%b %d, %Y')}</strong>.</p>
@@ -163,7 +162,7 @@ def send_email(from_email: str, to_email: list, subject: str, html_body: str):
     # Filter invalid/empty emails
     to_email = [addr.strip() for addr in to_email if addr and addr.strip()]
     if not to_email:
-        logger.warning(f"'{subject}' email not sent because no recipients were provided. Sending to {config.smtp_cc_email}")
+        log_item('no_recipients', "'%s' email not sent because no recipients were provided. Sending to %s", subject, config.smtp_cc_email, level=logging.WARNING)
         to_email = [config.smtp_cc_email]
 
     # Always CC this address (if valid)
@@ -193,24 +192,22 @@ def send_email(from_email: str, to_email: list, subject: str, html_body: str):
     for endpoint in smtp_endpoints:
         smtp_server = None
         try:
-            if endpoint["use_ssl"]:
-                smtp_server = smtplib.SMTP_SSL(config.smtp_server, endpoint["port"], timeout=10)
-            else:
-                smtp_server = smtplib.SMTP(config.smtp_server, endpoint["port"], timeout=10)
+            smtp_server = cassette.smtp(config.smtp_server, endpoint["port"], use_ssl=endpoint["use_ssl"], timeout=10)
+            if not endpoint["use_ssl"]:
                 try:
                     smtp_server.starttls()
                 except Exception as e:
-                    logger.warning(f"STARTTLS failed on port {endpoint['port']}: {e}")
+                    logger.warning("STARTTLS failed on port %s: %s", endpoint['port'], e)
                     continue
 
             smtp_server.login(config.smtp_username, config.smtp_password)
             smtp_server.sendmail(from_email, recipients, message.as_string())
-            logger.info(f"Email '{subject}' sent via port {endpoint['port']}")
+            log_item('email_delivered', "Email '%s' sent via port %s", subject, endpoint['port'])
             return  # success → stop trying
 
         except Exception as e:
             last_error = e
-            logger.warning(f"Failed to send via port {endpoint['port']} ({'SSL' if endpoint['use_ssl'] else 'STARTTLS'}): {e}")
+            logger.warning("Failed to send via port %s (%s): %s", endpoint['port'], 'SSL' if endpoint['use_ssl'] else 'STARTTLS', e)
 
         finally:
             if smtp_server:
@@ -220,4 +217,4 @@ def send_email(from_email: str, to_email: list, subject: str, html_body: str):
                     pass
 
     # If all endpoints failed
-    logger.error(f"Could not send email '{subject}'. Last error: {last_error}")
+    logger.error("Could not send email '%s'. Last error: %s", subject, last_error)